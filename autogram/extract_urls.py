@@ -8,8 +8,11 @@ and saves them to a JSON file.
 import os
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from duckduckgo_search import DDGS
 from dotenv import load_dotenv
+from autogram.jsonio import load_json, save_json
 
 # Load environment variables
 load_dotenv()
@@ -19,25 +22,57 @@ INPUT_FILE = 'media_plan.json'
 OUTPUT_FILE = 'urls.json'
 NUM_SOURCES = int(os.getenv('NUM_SOURCES', '3'))  # Number of sources to retrieve per topic
 SUMMARY_LANG = os.getenv('SUMMARY_LANG', 'en').lower()
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '4'))  # Number of searches run concurrently
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+SEARCH_CACHE_FILE = os.path.join(CACHE_DIR, 'search_cache.json')
 
 logging.basicConfig(level=logging.INFO)
 
+# One search session per worker thread. A DDGS instance rejects every call
+# after a failed one, so a session shared by all workers would let a single
+# rate limit fail every later query.
+search_sessions = threading.local()
+
+def get_search_session():
+    """Returns the calling thread's duckduckgo_search session, opening it on first use."""
+    ddgs = getattr(search_sessions, 'ddgs', None)
+    if ddgs is None:
+        ddgs = search_sessions.ddgs = DDGS()
+    return ddgs
+
 def search_relevant_urls(query, num_results=3):
-    """Searches for relevant URLs using duckduckgo_search."""
-    logging.info(f"Searching for relevant URLs for query: {query}")
+    """Searches for relevant URLs using the worker thread's duckduckgo_search session."""
+    logging.info("Searching for relevant URLs for query: %s", query)
     urls = []
-    with DDGS() as ddgs:
-        results = ddgs.text(query, region=SUMMARY_LANG, safesearch='Moderate')
+    # One failing search (e.g. a rate limit) must not discard the rest of the batch;
+    # it returns no URLs, which are not cached, so the query is retried next run
+    try:
+        results = get_search_session().text(query, region=SUMMARY_LANG, safesearch='Moderate')
         for result in results:
             urls.append(result['href'])
             if len(urls) >= num_results:
                 break
+    except Exception as e:
+        logging.error('Error searching for query %s: %s', query, e)
+        # The failed session refuses further calls, so the next query opens a new one
+        search_sessions.ddgs = None
+        return []
     return urls
 
+def load_search_cache():
+    """Loads cached search results, keyed by region, result count and query."""
+    try:
+        with open(SEARCH_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning('Ignoring unreadable search cache %s: %s', SEARCH_CACHE_FILE, e)
+        return {}
+
 def main():
     """Main function to build a list of URLs based on the media plan."""
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        media_plan = json.load(f)
+    media_plan = load_json(INPUT_FILE)
 
     # Adjusted to handle different possible structures
     if isinstance(media_plan, dict) and 'media_plan' in media_plan:
@@ -45,28 +80,48 @@ def main():
     elif isinstance(media_plan, list):
         pass
     else:
-        logging.error(f"Unexpected format in {INPUT_FILE}")
+        logging.error("Unexpected format in %s", INPUT_FILE)
         return
 
-    url_data = []
+    queries = []
 
     for idx, item in enumerate(media_plan):
-        logging.info(media_plan)
+        logging.debug('Media plan item %s: %s', idx, item)
         if not isinstance(item, dict):
-            logging.warning(f'Item at index {idx} is not a dictionary, skipping.')
+            logging.warning('Item at index %s is not a dictionary, skipping.', idx)
             continue
         topic = item.get('content_topic')
         key_messages = item.get('key_messages')
         item_id = item.get('item_id')
         if not topic or not key_messages:
-            logging.warning(f'Missing data in media plan item {idx}, skipping.')
+            logging.warning('Missing data in media plan item %s, skipping.', idx)
             continue
         # Construct the search query
-        query = f"{topic} {key_messages}"
-        # Search for relevant URLs
-        urls = search_relevant_urls(query, num_results=NUM_SOURCES)
+        queries.append((item_id, topic, f"{topic} {key_messages}"))
+
+    # Reruns reuse earlier results; only new queries hit the network
+    search_cache = load_search_cache()
+    cache_keys = [f"{SUMMARY_LANG}|{NUM_SOURCES}|{query}" for _, _, query in queries]
+    pending = [(key, query) for key, (_, _, query) in zip(cache_keys, queries) if key not in search_cache]
+
+    if pending:
+        # A few queries in flight at once, each worker reusing its own search session
+        with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as executor:
+            results = executor.map(lambda query: search_relevant_urls(query, num_results=NUM_SOURCES),
+                                   [query for _, query in pending])
+            for (key, _), urls in zip(pending, results):
+                # Empty results are not cached so the query is retried next run
+                if urls:
+                    search_cache[key] = urls
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        save_json(search_cache, SEARCH_CACHE_FILE)
+
+    url_data = []
+
+    for (item_id, topic, _), key in zip(queries, cache_keys):
+        urls = search_cache.get(key)
         if not urls:
-            logging.warning(f"No relevant URLs found for topic: {topic}")
+            logging.warning("No relevant URLs found for topic: %s", topic)
             continue
         url_data.append({
             'item_id': item_id,
@@ -74,10 +129,9 @@ def main():
             'urls': urls
         })
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(url_data, f, ensure_ascii=False, indent=4)
+    save_json(url_data, OUTPUT_FILE)
 
-    logging.info(f'URLs saved to {OUTPUT_FILE}')
+    logging.info('URLs saved to %s', OUTPUT_FILE)
 
 if __name__ == '__main__':
     main()
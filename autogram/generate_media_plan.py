@@ -6,10 +6,12 @@ This script uses OpenAI's API via the ell framework to generate a media plan and
 
 import os
 import json
+import functools
 import logging
 import openai
 import ell
 from dotenv import load_dotenv
+from autogram.jsonio import save_json
 
 # Load environment variables
 load_dotenv()
@@ -27,13 +29,11 @@ if not GOALS:
 
 logging.basicConfig(level=logging.INFO)
 
-# Initialize ell framework
-ell.init(store='./logdir', autocommit=True, verbose=True)
-openai.api_key = OPENAI_API_KEY
+# Client shared by the prompts below (ell's default is built before .env is loaded)
+openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
 
-@ell.simple(model='gpt-4o', temperature=0.9)
-def goals_validation(goals):
-    prompt = """
+# Prompts are built once at import instead of on every call
+GOALS_VALIDATION_PROMPT = """
     You are a group of three media experts:
 
     - One with a high-tech background
@@ -50,14 +50,7 @@ def goals_validation(goals):
     Your response should be a semicolon-separated list of rewritten and agreed-upon goals in English.
     """.strip()
 
-    return [
-      ell.system(prompt),
-      ell.user(f"list of goals: \n\n {goals}")
-    ]
-
-@ell.simple(model='gpt-4o-mini', temperature=0.1)
-def validate_media_plan_format(media_plan_json):
-    prompt = """
+MEDIA_PLAN_FORMAT_PROMPT = """
       you are seassoned tech-editor who should find any errors in JSON file and fix them, you are master of debugging and sorting problems.
       You answer should be valid JSON that can be parsed automaticly.
       Please use root element attribute 'media_plan' and keep original language of texts where it's possible.
@@ -77,15 +70,7 @@ def validate_media_plan_format(media_plan_json):
       Don't use any Markdown formating, only pure JSON object.
     """
 
-    return [
-      ell.system(prompt),
-      ell.user(f"correct following json: \n\n {media_plan_json}")
-    ]
-
-@ell.simple(model='gpt-4o', temperature=0.7)
-def generate_media_plan_prompt(goals):
-    """Generates a prompt for the media plan based on the provided goals."""
-    prompt = f"""
+MEDIA_PLAN_PROMPT_TEMPLATE = """
 You are a seasoned marketing strategist tasked with creating a media plan to achieve the following goals:
 {goals}
 
@@ -101,10 +86,34 @@ Please generate the media plan in English.
 Provide the plan in JSON format as a list of dictionaries, where each dictionary represents one content topic.
 Ensure that the JSON is properly formatted and parsable.
 """.strip()
-    return prompt
+
+@functools.cache
+def init_ell():
+    """Initializes the ell framework on first use rather than at import time."""
+    ell.init(store='./logdir', autocommit=True, verbose=True)
+
+@ell.simple(model='gpt-4o', client=openai_client, temperature=0.9)
+def goals_validation(goals):
+    return [
+      ell.system(GOALS_VALIDATION_PROMPT),
+      ell.user(f"list of goals: \n\n {goals}")
+    ]
+
+@ell.simple(model='gpt-4o-mini', client=openai_client, temperature=0.1)
+def validate_media_plan_format(media_plan_json):
+    return [
+      ell.system(MEDIA_PLAN_FORMAT_PROMPT),
+      ell.user(f"correct following json: \n\n {media_plan_json}")
+    ]
+
+@ell.simple(model='gpt-4o', client=openai_client, temperature=0.7)
+def generate_media_plan_prompt(goals):
+    """Generates a prompt for the media plan based on the provided goals."""
+    return MEDIA_PLAN_PROMPT_TEMPLATE.format(goals=goals)
 
 def generate_media_plan(goals):
     """Generates a media plan based on the provided goals using the ell framework."""
+    init_ell()
     response_text = validate_media_plan_format(
         generate_media_plan_prompt(
             goals_validation(
@@ -112,14 +121,14 @@ def generate_media_plan(goals):
             )
         )
     )
-    logging.debug(f"Media Plan Text: {response_text}")
+    logging.debug("Media Plan Text: %s", response_text)
 
     # Parse the response as JSON
     try:
         media_plan = json.loads(response_text)
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse media plan as JSON: {e}")
-        logging.debug(f"Response Text: {response_text}")
+        logging.error("Failed to parse media plan as JSON: %s", e)
+        logging.debug("Response Text: %s", response_text)
         # Optionally, implement a retry mechanism or save the raw response for manual inspection.
         return None
 
@@ -132,10 +141,9 @@ def main():
         logging.error("Failed to generate media plan.")
         return
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(media_plan, f, ensure_ascii=False, indent=4)
+    save_json(media_plan, OUTPUT_FILE)
 
-    logging.info(f"Media plan saved to {OUTPUT_FILE}")
+    logging.info("Media plan saved to %s", OUTPUT_FILE)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,30 @@
+"""
+JSON file helpers shared by the autogram scripts.
+
+orjson is used when it is installed (the "speedups" extra); the standard
+library fallback writes the same 2-space indented output.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def save_json(data, path):
+    """Writes data to a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+def load_json(path):
+    """Reads a JSON file, parsing the raw bytes with orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
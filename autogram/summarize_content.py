@@ -7,14 +7,25 @@ and saves the summaries to a JSON file.
 """
 
 import os
+import re
 import json
+import hashlib
 import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import openai
 import tiktoken
 import ell
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
 from dotenv import load_dotenv
+from autogram.jsonio import load_json, save_json
 
 # Load environment variables
 load_dotenv()
@@ -23,44 +34,152 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL_NAME = os.getenv('OPENAI_MODEL_NAME', 'gpt-4o')
 SUMMARY_LANG = os.getenv('SUMMARY_LANG', 'ru').lower()
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', '8'))  # Number of URLs processed concurrently
+MIN_SUMMARIZE_CHARS = int(os.getenv('MIN_SUMMARIZE_CHARS', '0'))  # Shorter articles skip summarization
+DOMAIN_DELAY = float(os.getenv('DOMAIN_DELAY', '0.2'))  # Minimum seconds between requests to one host
+MAX_INPUT_TOKENS = int(os.getenv('MAX_INPUT_TOKENS', '4096'))  # Article tokens sent to the summarizer
 INPUT_FILE = 'urls.json'
 OUTPUT_FILE = 'summaries.json'
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+PROMPT_VERSION = '1'  # Bump when the prompts or models below change to invalidate cached posts
+
+# Text nodes to keep when extracting an article; script and style bodies are skipped
+TEXT_XPATH = './/text()[not(ancestor::script or ancestor::style)]'
+# Without an <article>, also drop page chrome so menus and footers do not reach the LLM
+BODY_TEXT_XPATH = ('.//text()[not(ancestor::script or ancestor::style or ancestor::noscript'
+                   ' or ancestor::nav or ancestor::header or ancestor::footer or ancestor::aside)]')
+WHITESPACE_RE = re.compile(r'\s+')
+CHUNK_SIZE = 32768  # Bytes read from the response per parser feed
+MIN_HTML_BYTES = 200  # Smaller responses are error stubs, not articles
+MAX_HTML_BYTES = 5_000_000  # Stop reading oversized pages at this size
+MAX_CHARS_PER_TOKEN = 6  # Generous bound used to pre-trim text before tokenizing
 
 logging.basicConfig(level=logging.INFO)
 
+if not OPENAI_API_KEY:
+    raise ValueError("OPENAI_API_KEY environment variable is not set.")
+
 # Initialize Ell framework
 ell.init(store='./logdir', autocommit=True, verbose=True)
 
+# One explicit client for all prompts; ell's built-in one is created when ell is
+# imported, before load_dotenv() runs, so it may not see the API key
+openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
+
+# Shared HTTP session so connections are kept alive and reused across URLs
+http_session = requests.Session()
+http_session.headers.update({'User-Agent': 'Mozilla/5.0'})
+# Keep one pooled connection per worker and retry transient connection failures.
+# Error statuses are not retried and Retry-After is ignored, so a server asking
+# to wait cannot hold a worker beyond the request timeout.
+http_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=MAX_WORKERS,
+                           max_retries=Retry(total=2, connect=2, read=2, status=0,
+                                             backoff_factor=0.3,
+                                             respect_retry_after_header=False))
+http_session.mount('https://', http_adapter)
+http_session.mount('http://', http_adapter)
+
+class DomainRateLimiter:
+    """Spaces out requests to the same host while different hosts are fetched in parallel."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """Blocks until a request to the host of the given URL is allowed."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.delay
+        # Sleep outside the lock so other hosts are not held up
+        time.sleep(slot - now)
+
+domain_limiter = DomainRateLimiter(DOMAIN_DELAY)
+
 def fetch_content(url):
-    """Fetches the content from the given URL."""
-    headers = {'User-Agent': 'Mozilla/5.0'}
+    """
+    Fetches the given URL and parses the HTML while it is being downloaded.
+
+    The response body is streamed in chunks into an incremental lxml parser,
+    so parsing overlaps with the network transfer and the page is never held
+    in memory as a decoded string.
+
+    Args:
+        url (str): The URL to fetch.
+
+    Returns:
+        lxml.html.HtmlElement: The root of the parsed document, or None on failure.
+    """
+    domain_limiter.wait(url)
     try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        return response.text
+        with http_session.get(url, timeout=15, stream=True) as response:
+            response.raise_for_status()
+            # Only trust the HTTP charset when the server declares one; otherwise
+            # let libxml2 detect it from the BOM or <meta charset>.
+            content_type = response.headers.get('Content-Type', '').lower()
+            encoding = response.encoding if 'charset=' in content_type else None
+            try:
+                parser = lxml_html.HTMLParser(encoding=encoding)
+            except LookupError:
+                # A bogus charset must not drop the article; detect it instead
+                logging.warning('Unknown charset %s for %s, detecting it from the page', encoding, url)
+                parser = lxml_html.HTMLParser(encoding=None)
+            size = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                parser.feed(chunk)
+                size += len(chunk)
+                if size >= MAX_HTML_BYTES:
+                    logging.warning('Truncating %s at %s bytes', url, size)
+                    break
+            if size < MIN_HTML_BYTES:
+                logging.warning('Skipping %s: response is only %s bytes', url, size)
+                return None
+            return parser.close()
     except requests.RequestException as e:
-        logging.error(f'Error fetching {url}: {e}')
+        logging.error('Error fetching %s: %s', url, e)
         return None
+    except (LookupError, etree.LxmlError) as e:
+        logging.error('Error parsing %s: %s', url, e)
+        return None
+
+def parse_content(document):
+    """
+    Extracts the article text from an HTML document.
 
-def parse_content(html):
-    """Parses the HTML content and extracts the text."""
+    Args:
+        document: A parsed lxml tree as returned by fetch_content, or raw HTML
+            as str or bytes.
+
+    Returns:
+        str: The extracted text with whitespace collapsed, or None on failure.
+    """
     try:
-        soup = BeautifulSoup(html, 'html.parser')
-        article_tag = soup.find('article')
-        if article_tag:
-            text = article_tag.get_text(separator=' ', strip=True)
+        if isinstance(document, (str, bytes)):
+            document = lxml_html.fromstring(document)
+        articles = document.xpath('//article')
+        if articles:
+            text = ' '.join(articles[0].xpath(TEXT_XPATH))
         else:
-            body_tag = soup.find('body')
-            if body_tag:
-                text = body_tag.get_text(separator=' ', strip=True)
-            else:
-                text = soup.get_text(separator=' ', strip=True)
-        text = ' '.join(text.split())
-        return text
+            body = document.xpath('//body') or [document]
+            text = ' '.join(body[0].xpath(BODY_TEXT_XPATH))
+        return WHITESPACE_RE.sub(' ', text).strip()
     except Exception as e:
-        logging.error(f'Error parsing content: {e}')
+        logging.error('Error parsing content: %s', e)
         return None
 
+@lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """Returns the tiktoken encoding for the model, loading it only once per process."""
+    try:
+        # Get the encoding for the specified model
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Fallback encoding if model not found
+        return tiktoken.get_encoding("cl100k_base")
+
 def truncate_text(text, max_tokens=4096):
     """
     Truncates text to a maximum number of tokens using tiktoken.
@@ -72,24 +191,26 @@ def truncate_text(text, max_tokens=4096):
     Returns:
         str: The truncated text.
     """
-    try:
-        # Get the encoding for the specified model
-        encoding = tiktoken.encoding_for_model(OPENAI_MODEL_NAME)
-    except KeyError:
-        # Fallback encoding if model not found
-        encoding = tiktoken.get_encoding("cl100k_base")
-    # Encode the text into tokens
-    tokens = encoding.encode(text)
-    # Truncate tokens if necessary
-    if len(tokens) > max_tokens:
-        tokens = tokens[:max_tokens]
-    # Decode tokens back into text
-    truncated_text = encoding.decode(tokens)
+    # Every token covers at least one UTF-8 byte, so text that is no longer
+    # than the budget in bytes cannot exceed it and needs no tokenization.
+    if len(text) <= max_tokens and len(text.encode('utf-8')) <= max_tokens:
+        return text
+    # Tokens average about four characters, so text beyond MAX_CHARS_PER_TOKEN
+    # characters per allowed token is practically always cut; trim it before BPE
+    text = text[:max_tokens * MAX_CHARS_PER_TOKEN]
+    encoding = get_encoding(OPENAI_MODEL_NAME)
+    # Encode the text into tokens; article text is plain content, so skip
+    # special-token handling (which would also reject "<|endoftext|>")
+    tokens = encoding.encode_ordinary(text)
+    # Text within the budget is returned as is, without a decode round-trip
+    if len(tokens) <= max_tokens:
+        return text
+    # Decode the truncated tokens back into text
+    truncated_text = encoding.decode(tokens[:max_tokens])
     return truncated_text
 
-@ell.simple(model='gpt-4o', temperature=0.1)
-def editor(text):
-    prompt = """
+# System prompts depend only on configuration, so they are built once at import
+EDITOR_PROMPT = """
     Ты — главный "котан" и редактор персонального блога.
     Отредактируй текст, чтобы он был более личным и написан от первого лица для создания уютной атмосферы.
     При редактировании следуй принципам из книги "Пиши, сокращай":
@@ -101,89 +222,210 @@ def editor(text):
     - сфокусируйся на интересах читателя и решении его проблем
     - всегда используй профессиональный термины на английском языке такие как "embeddings", "metadata", "API", "LLM" и т.д.
     """.strip()
-    return [
-        ell.system(prompt),
-        ell.user(f"Проведи редактуру текста и предоставть финальный вариант. text: \n\n {text}")
-    ]
 
-@ell.simple(model="gpt-4o", temperature=0.1)
-def summarize_text(text):
-    """Summarizes the given text using a custom prompt."""
-    prompt = f"""
+SUMMARY_PROMPT = f"""
 As a professional content creator, you specialize in microblogging about lifestyle, personal growth, and cutting-edge technologies. Your engaging storytelling captivates an audience eager for both professional and personal development.
 You are tasked with providing concise, business-oriented blog posts in {SUMMARY_LANG} language. Summarize key insights in a couple of paragraphs, using emojis where appropriate to add personality and clarity. Avoid using titles or headings in markdown;
 instead, utilize bold text, lists, code blocks, or block quotes for formatting to enhance readability.
 Incorporate actionable advice and real-world examples to help your readers apply concepts immediately. Encourage community engagement by posing thought-provoking questions or inviting readers to share their experiences.
 """.strip()
+
+METADATA_PROMPT = """
+You are a person who is responsible for building cross-links, tags, references, and enriching texts with metadata properties.
+All available metadata should be wrapped with three dashes (---) at the beginning and end.
+Tags must be comma-separated, camelCase with a leading # symbol.
+Publication date must be in ISO 8601 format.
+""".strip()
+
+def serialize_first_call(prompt):
+    """
+    Runs calls to an ell prompt one at a time until one of them has succeeded.
+
+    ell stores each prompt version in ./logdir on its first call without any
+    locking, so concurrent first calls race on the insert and fail with an
+    IntegrityError after the API call has been paid for. Once the version is
+    stored, calls run in parallel.
+    """
+    lock = threading.Lock()
+    stored = False
+
+    @wraps(prompt)
+    def wrapper(*args, **kwargs):
+        nonlocal stored
+        if stored:
+            return prompt(*args, **kwargs)
+        with lock:
+            result = prompt(*args, **kwargs)
+            stored = True
+        return result
+    return wrapper
+
+@serialize_first_call
+@ell.simple(model='gpt-4o', client=openai_client, temperature=0.1)
+def editor(text):
+    return [
+        ell.system(EDITOR_PROMPT),
+        ell.user(f"Проведи редактуру текста и предоставть финальный вариант. text: \n\n {text}")
+    ]
+
+@serialize_first_call
+@ell.simple(model="gpt-4o", client=openai_client, temperature=0.1)
+def summarize_text(text):
+    """Summarizes the given text using a custom prompt."""
     return [
-        ell.system(prompt),
+        ell.system(SUMMARY_PROMPT),
         ell.user(f"Write a post based the text below: \n\n {text}")
     ]
 
-@ell.simple(model='gpt-4o-mini', temperature=1.0)
+@serialize_first_call
+@ell.simple(model='gpt-4o-mini', client=openai_client, temperature=1.0)
 def generate_metadata(text):
     """Extracts metadata from the given text."""
-    prompt = [
-        ell.system("""
-You are a person who is responsible for building cross-links, tags, references, and enriching texts with metadata properties.
-All available metadata should be wrapped with three dashes (---) at the beginning and end.
-Tags must be comma-separated, camelCase with a leading # symbol.
-Publication date must be in ISO 8601 format.
-""".strip()),
+    return [
+        ell.system(METADATA_PROMPT),
         ell.user(f"Return metadata ONLY for the text below: {text}")
     ]
-    return prompt
 
-def process_url(message_id, url):
-    """Processes a single URL: fetches content, parses it, and generates a summary and metadata."""
-    logging.info(f'Processing URL: {url}')
-    html = fetch_content(url)
-    if not html:
+def get_cache_path(content):
+    """Returns the cache file for the generated post of the given article text."""
+    # Anything that changes what the LLM sees is part of the key, so edited
+    # prompts, another model (which also picks the tokenizer) or a new token
+    # budget regenerate posts instead of reusing stale ones. Only whether the
+    # article skips summarization matters, not the threshold itself.
+    skips_summary = len(content) < MIN_SUMMARIZE_CHARS
+    key_source = f'{PROMPT_VERSION}\n{OPENAI_MODEL_NAME}\n{MAX_INPUT_TOKENS}\n{skips_summary}\n{content}'
+    key = hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, 'summaries', SUMMARY_LANG, f'{key}.json')
+
+def load_cached_post(path):
+    """Loads a previously generated post from the cache, or returns None on a miss."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
         return None
-    content = parse_content(html)
-    if not content:
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning('Ignoring unreadable cache entry %s: %s', path, e)
         return None
-    text = truncate_text(content)
-    summary = summarize_text(text)
+
+def save_cached_post(path, post):
+    """Stores a generated post in the cache, replacing the file atomically."""
+    # The post is already paid for, so a cache that cannot be written is only
+    # logged; the caller still gets to save the post to summaries.json.
+    cache_dir = os.path.dirname(path)
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(post, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning('Failed to write cache entry %s: %s', path, e)
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+def generate_post(url, content):
+    """Generates the summary, metadata and edited blog post for the article text."""
+    if len(content) < MIN_SUMMARIZE_CHARS:
+        # The article is already post-sized; use it as is instead of asking the LLM to shorten it
+        summary = content
+    else:
+        text = truncate_text(content, max_tokens=MAX_INPUT_TOKENS)
+        summary = summarize_text(text)
     if not summary:
-        logging.error(f'Failed to generate summary for {url}')
+        logging.error('Failed to generate summary for %s', url)
         return None
     metadata = generate_metadata(summary)
     if not metadata:
-        logging.error(f'Failed to generate metadata for {url}')
+        logging.error('Failed to generate metadata for %s', url)
         return None
     blog_post = editor(summary+metadata)
     if not blog_post:
-        logging.error(f'Failed to generate blog post for {url}')
+        logging.error('Failed to generate blog post for %s', url)
         return None
     return {
-        'message_id': message_id,
-        'url': url,
         'summary': summary,
         'blog_post': blog_post,
         'metadata': metadata
     }
 
-def main():
-    """Main function to process URLs and generate summaries."""
-    openai.api_key = OPENAI_API_KEY
+def normalize_url(url):
+    """Drops the fragment and utm_* tracking parameters so the same article has one URL."""
+    parts = urlsplit(url)
+    # Filter the raw query segments instead of re-encoding them, so the other
+    # parameters stay exactly as shared and the same page is fetched
+    kept = [param for param in parts.query.split('&')
+            if not unquote_plus(param.partition('=')[0]).lower().startswith('utm_')]
+    return urlunsplit(parts._replace(query='&'.join(kept), fragment=''))
 
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-        url_data = json.load(f)
+def process_url(message_id, url):
+    """Processes a single URL: fetches content, parses it, and generates a summary and metadata."""
+    logging.info('Processing URL: %s', url)
+    document = fetch_content(url)
+    if document is None:
+        return None
+    content = parse_content(document)
+    if not content:
+        return None
+    # Articles are cached by their text, so unchanged or republished content
+    # skips the LLM calls entirely.
+    cache_path = get_cache_path(content)
+    post = load_cached_post(cache_path)
+    if post:
+        logging.info('Using cached summary for %s', url)
+    else:
+        post = generate_post(url, content)
+        if not post:
+            return None
+        save_cached_post(cache_path, post)
+    return {
+        'message_id': message_id,
+        'url': url,
+        **post
+    }
 
-    summaries = []
+def main():
+    """Main function to process URLs and generate summaries."""
+    url_data = load_json(INPUT_FILE)
 
+    # Process each URL once, even if several messages link to it
+    seen_urls = set()
+    work = []
     for item in url_data:
-        message_id = item['message_id']
         for url in item['urls']:
-            result = process_url(message_id, url)
+            url = normalize_url(url)
+            if url in seen_urls:
+                logging.info('Skipping duplicate URL: %s', url)
+                continue
+            seen_urls.add(url)
+            work.append((item['message_id'], url))
+
+    # Load the tokenizer once up front; otherwise the first workers would each
+    # load the BPE tables concurrently before the cache is filled
+    get_encoding(OPENAI_MODEL_NAME)
+
+    # Fetching and LLM calls are I/O-bound, so a bounded thread pool lets
+    # several URLs be in flight without opening unlimited connections.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [executor.submit(process_url, message_id, url) for message_id, url in work]
+        summaries = []
+        for (_, url), future in zip(work, futures):
+            # One failing URL (e.g. an API error) must not discard the rest of the batch
+            try:
+                result = future.result()
+            except Exception:
+                logging.exception('Unexpected error processing %s', url)
+                continue
             if result:
                 summaries.append(result)
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(summaries, f, ensure_ascii=False, indent=4)
+    save_json(summaries, OUTPUT_FILE)
 
-    logging.info(f'Summaries saved to {OUTPUT_FILE}')
+    logging.info('Summaries saved to %s', OUTPUT_FILE)
 
 if __name__ == '__main__':
     main()
@@ -8,13 +8,19 @@ Handles rate limits by catching FloodWait exceptions.
 """
 
 import os
-import json
+import sys
 import logging
 import asyncio
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 from telethon.errors import SessionPasswordNeededError, FloodWaitError
 from dotenv import load_dotenv
+from autogram.jsonio import load_json
+
+try:
+    import uvloop
+except ImportError:  # optional, e.g. on Windows; the default event loop is used instead
+    uvloop = None
 
 # Load environment variables
 load_dotenv()
@@ -37,7 +43,6 @@ async def main():
         client = TelegramClient('autogram', API_ID, API_HASH)
 
     async with client:
-        print("Your session string is:", client.session.save())
         if not await client.is_user_authorized():
             try:
                 await client.send_code_request(PHONE_NUMBER)
@@ -46,9 +51,13 @@ async def main():
             except SessionPasswordNeededError:
                 password = input('Two-Step Verification enabled. Please enter your password: ')
                 await client.sign_in(password=password)
+            # Show the new session only once, right after login, so it can be
+            # stored in TELEGRAM_SESSION_STRING instead of leaking on every run.
+            # It grants full account access, so it goes to the terminal only and
+            # never through logging, whose handlers may persist it.
+            print("Your session string is:", StringSession.save(client.session), file=sys.stderr)
 
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            summaries_data = json.load(f)
+        summaries_data = load_json(INPUT_FILE)
 
         # Sort the summaries by message_id in ascending order
         summaries_data.sort(key=lambda x: x['message_id'])
@@ -64,15 +73,18 @@ async def main():
             while not sent:
                 try:
                     new_message = await client.send_message(DESTINATION_CHANNEL_NAME, message_text)
-                    logging.info(f'Sent new message with ID {new_message.id} to {DESTINATION_CHANNEL_NAME}')
+                    logging.info('Sent new message with ID %s to %s', new_message.id, DESTINATION_CHANNEL_NAME)
                     sent = True
                 except FloodWaitError as e:
                     wait_time = e.seconds
-                    logging.warning(f'Rate limit exceeded. Waiting for {wait_time} seconds...')
+                    logging.warning('Rate limit exceeded. Waiting for %s seconds...', wait_time)
                     await asyncio.sleep(wait_time)
                 except Exception as e:
-                    logging.error(f'Error sending message: {e}')
+                    logging.error('Error sending message: %s', e)
                     sent = True  # Skip this message to prevent infinite loop
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
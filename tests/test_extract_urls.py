@@ -0,0 +1,67 @@
+import importlib
+import json
+import sys
+
+import pytest
+
+
+class FakeDDGS:
+    """Stands in for DDGS, refusing every call after a failed one like the real session."""
+
+    instances = 0
+
+    def __init__(self):
+        FakeDDGS.instances += 1
+        self.failed = False
+
+    def text(self, query, **kwargs):
+        if self.failed:
+            raise RuntimeError('Exception occurred in previous call.')
+        if query.startswith('ratelimited'):
+            self.failed = True
+            raise RuntimeError('202 Ratelimit')
+        return [{'href': f'https://example.com/{query.split()[0]}/{i}'} for i in range(5)]
+
+
+@pytest.fixture
+def eu(monkeypatch, tmp_path):
+    """Imports extract_urls inside a scratch directory with the search session stubbed out."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(sys.modules, 'autogram.extract_urls', raising=False)
+    module = importlib.import_module('autogram.extract_urls')
+    monkeypatch.setattr(module, 'DDGS', FakeDDGS)
+    FakeDDGS.instances = 0
+    return module
+
+
+def write_media_plan(topics):
+    items = [{'item_id': i, 'content_topic': topic, 'key_messages': 'news'}
+             for i, topic in enumerate(topics)]
+    with open('media_plan.json', 'w', encoding='utf-8') as f:
+        json.dump(items, f)
+
+
+def test_main_keeps_finished_searches_when_one_fails(eu):
+    write_media_plan(['first', 'ratelimited', 'last'])
+    eu.main()
+
+    with open('urls.json', encoding='utf-8') as f:
+        topics = [item['topic'] for item in json.load(f)]
+    assert topics == ['first', 'last']
+    with open(eu.SEARCH_CACHE_FILE, encoding='utf-8') as f:
+        cached = json.load(f)
+    # The failed query is not cached, so the next run retries it
+    assert sorted(cached) == [f'{eu.SUMMARY_LANG}|{eu.NUM_SOURCES}|first news',
+                              f'{eu.SUMMARY_LANG}|{eu.NUM_SOURCES}|last news']
+
+
+def test_failed_search_session_is_replaced(eu, monkeypatch):
+    # A single worker runs every query on one thread, after the failure too
+    monkeypatch.setattr(eu, 'SEARCH_WORKERS', 1)
+    write_media_plan(['ratelimited', 'second', 'third'])
+    eu.main()
+
+    with open('urls.json', encoding='utf-8') as f:
+        topics = [item['topic'] for item in json.load(f)]
+    assert topics == ['second', 'third']
+    assert FakeDDGS.instances == 2
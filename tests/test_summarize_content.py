@@ -0,0 +1,230 @@
+import importlib
+import io
+import os
+import sys
+
+import pytest
+import requests
+import tiktoken
+
+
+@pytest.fixture
+def sc(mocker, monkeypatch):
+    """Imports summarize_content with ell's store and the OpenAI client stubbed out."""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    mocker.patch('ell.init')
+    mocker.patch('openai.OpenAI')
+    monkeypatch.delitem(sys.modules, 'autogram.summarize_content', raising=False)
+    return importlib.import_module('autogram.summarize_content')
+
+
+@pytest.fixture
+def byte_encoding(sc, mocker):
+    """A real tiktoken encoding with one token per byte plus "ab", so no BPE file is downloaded."""
+    ranks = {bytes([i]): i for i in range(256)}
+    ranks[b'ab'] = 256
+    encoding = tiktoken.Encoding(
+        name='test_bytes',
+        pat_str=r'\S+|\s+',
+        mergeable_ranks=ranks,
+        special_tokens={'<|endoftext|>': 257},
+    )
+    mocker.patch.object(sc, 'get_encoding', return_value=encoding)
+    return encoding
+
+
+class CountingBytesIO(io.BytesIO):
+    """A response body that remembers how many bytes were read from it."""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def make_response(body, content_type='text/html; charset=utf-8'):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.raw = CountingBytesIO(body)
+    return response
+
+
+@pytest.fixture
+def serve(sc, mocker):
+    """Makes fetch_content receive the given response instead of hitting the network."""
+    mocker.patch.object(sc.domain_limiter, 'wait')
+
+    def serve(response):
+        mocker.patch.object(sc.http_session, 'get', return_value=response)
+        return response
+    return serve
+
+def test_truncate_text_skips_tokenizer_for_short_text(sc, mocker):
+    get_encoding = mocker.patch.object(sc, 'get_encoding')
+    text = 'short text'
+    assert sc.truncate_text(text, max_tokens=10) is text
+    get_encoding.assert_not_called()
+
+
+def test_truncate_text_counts_bytes_not_characters(sc, byte_encoding):
+    # Six characters but twelve UTF-8 bytes, so the shortcut must not apply
+    assert sc.truncate_text('привет', max_tokens=8) == 'прив'
+
+
+def test_truncate_text_returns_text_within_budget_unchanged(sc, byte_encoding, mocker):
+    # Twenty bytes but only ten tokens, so the text is tokenized yet not cut
+    decode = mocker.spy(byte_encoding, 'decode')
+    text = 'ab' * 10
+    assert sc.truncate_text(text, max_tokens=15) is text
+    decode.assert_not_called()
+
+
+def test_truncate_text_cuts_to_max_tokens(sc, byte_encoding):
+    assert sc.truncate_text('word ' * 100, max_tokens=12) == 'word word wo'
+
+
+def test_truncate_text_treats_endoftext_as_plain_text(sc, byte_encoding):
+    text = 'before <|endoftext|> after ' * 10
+    with pytest.raises(ValueError):
+        byte_encoding.encode(text)
+    assert sc.truncate_text(text, max_tokens=30) == text[:30]
+
+
+def test_normalize_url_drops_tracking_parameters_and_fragment(sc):
+    url = 'https://example.com/post?utm_source=tg&id=7&UTM_Medium=social#comments'
+    assert sc.normalize_url(url) == 'https://example.com/post?id=7'
+
+
+def test_normalize_url_keeps_other_queries_untouched(sc):
+    url = 'https://example.com/search?q=a%20b&page=2&flag#top'
+    assert sc.normalize_url(url) == 'https://example.com/search?q=a%20b&page=2&flag'
+
+
+def test_normalize_url_keeps_parameters_next_to_tracking_ones_untouched(sc):
+    url = 'https://example.com/search?q=a%20b&flag&utm_source=x'
+    assert sc.normalize_url(url) == 'https://example.com/search?q=a%20b&flag'
+    url = 'https://example.com/list?a=1;b=2&utm_campaign=z&utm%5Fmedium=y'
+    assert sc.normalize_url(url) == 'https://example.com/list?a=1;b=2'
+    assert sc.normalize_url('https://example.com/?utm_source=x') == 'https://example.com/'
+
+
+def test_domain_rate_limiter_spaces_requests_per_host(sc, mocker):
+    clock = mocker.patch.object(sc, 'time')
+    clock.monotonic.return_value = 100.0
+    limiter = sc.DomainRateLimiter(0.5)
+
+    limiter.wait('https://a.example/1')
+    limiter.wait('https://a.example/2')
+    limiter.wait('https://b.example/1')
+    limiter.wait('https://a.example/3')
+
+    assert [c.args[0] for c in clock.sleep.call_args_list] == [0.0, 0.5, 0.0, 1.0]
+
+
+def test_parse_content_prefers_article(sc):
+    document = (
+        '<html><body><nav>Menu</nav>'
+        '<article><p>Hello</p><script>track()</script><p>world</p></article>'
+        '<footer>Footer</footer></body></html>'
+    )
+    assert sc.parse_content(document) == 'Hello world'
+
+
+def test_parse_content_drops_page_chrome_without_article(sc):
+    document = (
+        b'<html><body><header>Site</header><nav>Menu</nav>'
+        b'<main><p>Body\n  text</p><style>p {}</style></main>'
+        b'<aside>Ads</aside><noscript>Enable JS</noscript><footer>Footer</footer>'
+        b'</body></html>'
+    )
+    assert sc.parse_content(document) == 'Body text'
+
+
+def test_parse_content_accepts_parsed_tree(sc):
+    tree = sc.lxml_html.fromstring('<html><body><article>Parsed tree</article></body></html>')
+    assert sc.parse_content(tree) == 'Parsed tree'
+
+
+def test_cache_path_depends_on_model(sc, monkeypatch):
+    path = sc.get_cache_path('article text')
+    monkeypatch.setattr(sc, 'OPENAI_MODEL_NAME', 'gpt-4o-mini')
+    assert sc.get_cache_path('article text') != path
+
+
+def test_cache_path_depends_only_on_summarization_skip(sc, monkeypatch):
+    content = 'a' * 100
+    monkeypatch.setattr(sc, 'MIN_SUMMARIZE_CHARS', 0)
+    path = sc.get_cache_path(content)
+    monkeypatch.setattr(sc, 'MIN_SUMMARIZE_CHARS', 50)
+    assert sc.get_cache_path(content) == path
+    monkeypatch.setattr(sc, 'MIN_SUMMARIZE_CHARS', 500)
+    assert sc.get_cache_path(content) != path
+
+
+def test_fetch_content_detects_charset_when_declared_one_is_unknown(sc, serve):
+    body = ('<html><head><meta charset="utf-8"></head><body><article>Привет, мир. '
+            + 'x' * 300 + '</article></body></html>').encode('utf-8')
+    serve(make_response(body, content_type='text/html; charset=foobar'))
+    document = sc.fetch_content('https://example.com/post')
+    assert sc.parse_content(document).startswith('Привет, мир.')
+
+
+def test_fetch_content_skips_tiny_error_pages(sc, serve):
+    serve(make_response(b'<html><body>Not found</body></html>'))
+    assert sc.fetch_content('https://example.com/missing') is None
+
+
+def test_fetch_content_stops_reading_oversized_pages(sc, serve, monkeypatch):
+    monkeypatch.setattr(sc, 'CHUNK_SIZE', 100)
+    monkeypatch.setattr(sc, 'MAX_HTML_BYTES', 1000)
+    response = serve(make_response(b'<html><body><article>' + b'x' * 10_000))
+    document = sc.fetch_content('https://example.com/huge')
+    assert response.raw.bytes_read == 1000
+    assert sc.parse_content(document).startswith('xxx')
+
+
+POST = {'summary': 'Summary', 'blog_post': 'Post', 'metadata': '---\ntags: #test\n---'}
+
+
+def test_process_url_keeps_post_when_cache_cannot_be_written(sc, mocker, monkeypatch, tmp_path):
+    # A regular file where the cache directory should be makes every write fail
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    monkeypatch.setattr(sc, 'CACHE_DIR', str(blocker / 'cache'))
+    mocker.patch.object(sc, 'fetch_content',
+                        return_value=sc.lxml_html.fromstring('<html><body><article>Text</article></body></html>'))
+    mocker.patch.object(sc, 'generate_post', return_value=POST)
+
+    assert sc.process_url(1, 'https://example.com/post') == {'message_id': 1, 'url': 'https://example.com/post', **POST}
+
+
+def test_cached_post_round_trip(sc, monkeypatch, tmp_path):
+    monkeypatch.setattr(sc, 'CACHE_DIR', str(tmp_path))
+    path = sc.get_cache_path('article text')
+    assert sc.load_cached_post(path) is None
+    sc.save_cached_post(path, POST)
+    assert sc.load_cached_post(path) == POST
+    # The temp file was renamed into place, not left behind
+    assert [p.name for p in (tmp_path / 'summaries' / sc.SUMMARY_LANG).iterdir()] == [os.path.basename(path)]
+
+
+def test_main_isolates_failing_urls(sc, mocker, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    sc.save_json([{'message_id': 1, 'urls': ['https://example.com/a', 'https://example.com/broken']},
+                  {'message_id': 2, 'urls': ['https://example.com/b']}], 'urls.json')
+    mocker.patch.object(sc, 'get_encoding')
+
+    def process_url(message_id, url):
+        if url.endswith('broken'):
+            raise RuntimeError('API error')
+        return {'message_id': message_id, 'url': url, **POST}
+    mocker.patch.object(sc, 'process_url', side_effect=process_url)
+
+    sc.main()
+
+    summaries = sc.load_json('summaries.json')
+    assert [item['url'] for item in summaries] == ['https://example.com/a', 'https://example.com/b']